@@ -7,16 +7,63 @@ Author: Paul Harvener
 Catalog search service backed by Elasticsearch with deterministic fallback.
 """
 
-import json
+import asyncio
+import gzip
 import os
-import time
+import random
+import sys
+import threading
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
-from elasticsearch import Elasticsearch, helpers
+import numpy as np
+import orjson
+from cachetools import TTLCache
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
 
 from app.models import ProductResult, QueryIntent
 
+_CATALOG_PATH = Path(__file__).resolve().parent.parent / "data" / "catalog.ndjson.gz"
+
+_RESULT_SOURCE_FIELDS = [
+    "id",
+    "manufacturer",
+    "manufacturer_part_number",
+    "name",
+    "description",
+    "category",
+    "unit_price",
+    "quantity_available",
+    "product_url",
+    "datasheet_url",
+    "tags",
+    "use_cases",
+]
+
+_INTERNED_SPEC_KEYS = ("package", "series", "interface", "generation", "status")
+_PUNCT_TRANS = str.maketrans("", "", ",.?!;:()[]\"'")
+
+_STOP_WORDS: frozenset[str] = frozenset(
+    {
+        "find",
+        "need",
+        "with",
+        "that",
+        "this",
+        "for",
+        "the",
+        "and",
+        "top",
+        "best",
+        "under",
+        "cheapest",
+        "in",
+        "stock",
+        "in-stock",
+    }
+)
+
 
 class CatalogService:
     # Args:
@@ -32,10 +79,21 @@ class CatalogService:
         self.es_password = os.getenv("ELASTICSEARCH_PASSWORD") or None
         self.connect_attempts = int(os.getenv("ELASTICSEARCH_CONNECT_ATTEMPTS", "5"))
         self.connect_sleep_seconds = float(os.getenv("ELASTICSEARCH_CONNECT_SLEEP_SECONDS", "1.0"))
+        self.connect_max_sleep_seconds = float(os.getenv("ELASTICSEARCH_CONNECT_MAX_SLEEP_SECONDS", "2"))
+        self.bulk_chunk_size = int(os.getenv("ELASTICSEARCH_BULK_CHUNK_SIZE", "500"))
+        self.pool_size = int(os.getenv("ELASTICSEARCH_POOL_SIZE", "25"))
 
-        self._client: Elasticsearch | None = None
+        self._client: AsyncElasticsearch | None = None
         self._mode = "fallback"
+        self._search_cache: TTLCache = TTLCache(maxsize=512, ttl=60)
+        self._search_cache_lock = threading.Lock()
         self._fallback_docs = self._load_seed_catalog()
+        self._fallback_haystacks = [_doc_haystack(doc) for doc in self._fallback_docs]
+        self._postings = _build_postings(self._fallback_haystacks)
+        self._quantity_np = np.array([doc["quantity_available"] for doc in self._fallback_docs], dtype=np.float64)
+        self._price_np = np.array([doc["unit_price"] for doc in self._fallback_docs], dtype=np.float64)
+        self._stock_np = np.minimum(self._quantity_np / 10000, 1.0)
+        self._price_score_np = 1 / (1 + np.maximum(self._price_np, 0.0))
 
     # Args:
     #   None
@@ -53,21 +111,34 @@ class CatalogService:
     #     Warning text when Elasticsearch is unavailable; otherwise None.
     # Notes:
     #   Initializes index/mapping and seeds data if index is empty.
-    def initialize(self) -> str | None:
-        client = self._connect_with_retry(
+    async def initialize(self) -> str | None:
+        client = await self._connect_with_retry(
             max_attempts=self.connect_attempts,
             sleep_seconds=self.connect_sleep_seconds,
+            max_sleep_seconds=self.connect_max_sleep_seconds,
         )
         if client is None:
             self._mode = "fallback"
             return "Elasticsearch is unavailable; using local fallback catalog."
 
         self._client = client
-        self._ensure_index()
-        self._seed_if_empty()
+        await self._ensure_index()
+        await self._seed_if_empty()
         self._mode = "elasticsearch"
         return None
 
+    # Args:
+    #   None
+    # Returns:
+    #   None
+    # Notes:
+    #   Closes the Elasticsearch client connection pool on shutdown.
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        self._mode = "fallback"
+
     # Args:
     #   intent: QueryIntent
     #     Parsed user intent with constraints and sort preference.
@@ -76,34 +147,77 @@ class CatalogService:
     #     Product list and optional warning string.
     # Notes:
     #   Uses Elasticsearch when available and automatically falls back on error.
-    def search(self, intent: QueryIntent) -> tuple[list[ProductResult], str | None]:
+    #   Successful results are cached briefly per intent signature.
+    async def search(self, intent: QueryIntent) -> tuple[list[ProductResult], str | None]:
+        cache_key = (
+            self._mode,
+            intent.keywords.lower(),
+            intent.limit,
+            intent.in_stock_only,
+            intent.min_quantity,
+            intent.max_unit_price,
+            intent.sort_preference,
+        )
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached[0]), cached[1]
+
         if self._mode != "elasticsearch" or self._client is None:
-            return self._fallback_search(intent), "Results are from fallback data, not Elasticsearch."
+            results = self._fallback_search(intent)
+            warning = "Results are from fallback data, not Elasticsearch."
+        else:
+            try:
+                results, warning = await self._search_elasticsearch(intent), None
+            except Exception as exc:
+                return self._fallback_search(intent), f"Elasticsearch query failed ({exc}); using fallback data."
 
-        try:
-            return self._search_elasticsearch(intent), None
-        except Exception as exc:
-            return self._fallback_search(intent), f"Elasticsearch query failed ({exc}); using fallback data."
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = (tuple(results), warning)
+        return results, warning
 
     # Args:
     #   max_attempts: int
     #     Number of ping attempts.
     #   sleep_seconds: float
-    #     Delay between attempts.
+    #     Base delay between attempts.
+    #   max_sleep_seconds: float
+    #     Upper bound for the exponential backoff delay.
     # Returns:
-    #   Elasticsearch | None
+    #   AsyncElasticsearch | None
     #     Connected Elasticsearch client or None after timeout.
-    def _connect_with_retry(self, max_attempts: int, sleep_seconds: float) -> Elasticsearch | None:
+    # Notes:
+    #   Sleeps a jittered exponential delay so restarting clients do not reconnect in lockstep.
+    #   The small default cap keeps the total wait close to attempts * sleep_seconds,
+    #   since startup blocks in the lifespan hook until this returns; no sleep after the last attempt.
+    async def _connect_with_retry(
+        self,
+        max_attempts: int,
+        sleep_seconds: float,
+        max_sleep_seconds: float,
+    ) -> AsyncElasticsearch | None:
         auth = (self.es_username, self.es_password) if self.es_username and self.es_password else None
 
-        for _ in range(max_attempts):
+        for attempt in range(max_attempts):
+            client = AsyncElasticsearch(
+                self.es_url,
+                basic_auth=auth,
+                request_timeout=15,
+                connections_per_node=self.pool_size,
+                http_compress=True,
+                retry_on_timeout=True,
+                max_retries=2,
+            )
             try:
-                client = Elasticsearch(self.es_url, basic_auth=auth, request_timeout=15)
-                if client.ping():
+                if await client.ping():
                     return client
             except Exception:
                 pass
-            time.sleep(sleep_seconds)
+            await client.close()
+            if attempt == max_attempts - 1:
+                break
+            backoff = min(max_sleep_seconds, sleep_seconds * (2**attempt))
+            await asyncio.sleep(random.uniform(sleep_seconds, backoff))
         return None
 
     # Args:
@@ -112,9 +226,9 @@ class CatalogService:
     #   None
     # Notes:
     #   Creates the product index with mapping if it does not exist.
-    def _ensure_index(self) -> None:
+    async def _ensure_index(self) -> None:
         assert self._client is not None
-        if self._client.indices.exists(index=self.es_index):
+        if await self._client.indices.exists(index=self.es_index):
             return
 
         mapping = {
@@ -136,7 +250,7 @@ class CatalogService:
                 }
             }
         }
-        self._client.indices.create(index=self.es_index, **mapping)
+        await self._client.indices.create(index=self.es_index, **mapping)
 
     # Args:
     #   None
@@ -144,20 +258,30 @@ class CatalogService:
     #   None
     # Notes:
     #   Bulk loads fallback docs into Elasticsearch only when index is empty.
-    def _seed_if_empty(self) -> None:
+    async def _seed_if_empty(self) -> None:
         assert self._client is not None
-        count = self._client.count(index=self.es_index)["count"]
+        count = (await self._client.count(index=self.es_index))["count"]
         if count > 0:
             return
 
-        actions = []
-        for doc in self._fallback_docs:
-            doc_copy = dict(doc)
-            doc_copy["spec_blob"] = _spec_blob_from_doc(doc_copy)
-            actions.append({"_index": self.es_index, "_id": doc_copy["id"], "_source": doc_copy})
+        await async_bulk(
+            self._client,
+            self._iter_seed_actions(),
+            chunk_size=self.bulk_chunk_size,
+            max_chunk_bytes=10 * 1024 * 1024,
+        )
 
-        if actions:
-            helpers.bulk(self._client, actions)
+        with self._search_cache_lock:
+            self._search_cache.clear()
+
+    # Args:
+    #   None
+    # Returns:
+    #   Iterator[dict[str, Any]]
+    #     Bulk index actions for fallback docs, yielded one at a time.
+    def _iter_seed_actions(self) -> Iterator[dict[str, Any]]:
+        for doc in self._fallback_docs:
+            yield {"_index": self.es_index, "_id": doc["id"], "_source": doc}
 
     # Args:
     #   intent: QueryIntent
@@ -167,13 +291,14 @@ class CatalogService:
     #     Ranked search results from Elasticsearch.
     # Notes:
     #   Ranking blends ES relevance with stock/price/coverage scoring.
-    def _search_elasticsearch(self, intent: QueryIntent) -> list[ProductResult]:
+    async def _search_elasticsearch(self, intent: QueryIntent) -> list[ProductResult]:
         assert self._client is not None
 
-        must = [
+        should: list[dict[str, Any]] = [
             {
                 "multi_match": {
                     "query": intent.keywords,
+                    "type": "best_fields",
                     "fields": [
                         "name^4",
                         "description^3",
@@ -183,10 +308,42 @@ class CatalogService:
                         "use_cases^2",
                         "spec_blob",
                     ],
+                }
+            },
+            {
+                "multi_match": {
+                    "query": intent.keywords,
+                    "fields": ["name^4", "description^3", "tags^2"],
                     "fuzziness": "AUTO",
+                    "prefix_length": 2,
+                    "max_expansions": 32,
                 }
-            }
+            },
+            {
+                "term": {
+                    "manufacturer_part_number": {
+                        "value": intent.keywords.strip(),
+                        "case_insensitive": True,
+                        "boost": 3.0,
+                    }
+                }
+            },
         ]
+        # Part numbers are high-cardinality keywords: match them by exact term or prefix, never fuzzily.
+        mpn_prefix = _mpn_prefix_token(intent.keywords)
+        if mpn_prefix:
+            should.append(
+                {
+                    "prefix": {
+                        "manufacturer_part_number": {
+                            "value": mpn_prefix,
+                            "case_insensitive": True,
+                            "boost": 2.0,
+                        }
+                    }
+                }
+            )
+        must = [{"bool": {"should": should, "minimum_should_match": 1}}]
 
         filters: list[dict[str, Any]] = []
         if intent.in_stock_only:
@@ -202,24 +359,32 @@ class CatalogService:
         elif intent.sort_preference == "stock_high":
             sort = [{"quantity_available": "desc"}, "_score"]
 
-        response = self._client.search(
+        response = await self._client.search(
             index=self.es_index,
             query={"bool": {"must": must, "filter": filters}},
             size=intent.limit,
             sort=sort,
+            source=_RESULT_SOURCE_FIELDS,
+            track_total_hits=False,
+            filter_path=["hits.hits._source", "hits.hits._score"],
         )
 
         hits = response.get("hits", {}).get("hits", [])
         if not hits:
             return []
 
-        top_score = max((hit.get("_score") or 1.0) for hit in hits)
+        top_score = 0.0
+        scored_docs: list[tuple[dict[str, Any], float]] = []
+        for hit in hits:
+            raw_score = hit.get("_score")
+            top_score = max(top_score, raw_score or 1.0)
+            scored_docs.append((hit.get("_source", {}), float(raw_score or 0.0)))
+
+        query_tokens = _query_tokens(intent.keywords)
         results: list[ProductResult] = []
 
-        for hit in hits:
-            doc = hit.get("_source", {})
-            score = float(hit.get("_score") or 0.0)
-            coverage = _keyword_coverage(intent.keywords, doc)
+        for doc, score in scored_docs:
+            coverage = _keyword_coverage_tokens(query_tokens, _doc_haystack(doc))
             recommendation_score = _recommendation_score(score, top_score, doc, coverage)
             reason = _build_reason(doc, recommendation_score, coverage)
             results.append(
@@ -250,55 +415,43 @@ class CatalogService:
     #     Ranked fallback results from local JSON catalog.
     # Notes:
     #   Provides resiliency when Elasticsearch is unavailable.
+    #   Constraints and scoring are vectorized; only the top hits become ProductResult objects.
     def _fallback_search(self, intent: QueryIntent) -> list[ProductResult]:
-        stop_words = {
-            "find",
-            "need",
-            "with",
-            "that",
-            "this",
-            "for",
-            "the",
-            "and",
-            "top",
-            "best",
-            "under",
-            "cheapest",
-            "stock",
-            "in-stock",
-        }
-        query_tokens = {
-            token.strip(",.?!")
-            for token in intent.keywords.lower().split()
-            if len(token) > 2 and token.strip(",.?!") not in stop_words
-        }
-        results: list[ProductResult] = []
+        query_tokens = _query_tokens(intent.keywords)
+        if query_tokens:
+            doc_ids = np.array(self._candidate_ids(query_tokens), dtype=np.intp)
+        else:
+            doc_ids = np.arange(len(self._fallback_docs))
+
+        quantities = self._quantity_np[doc_ids]
+        mask = np.ones(doc_ids.size, dtype=bool)
+        if intent.in_stock_only:
+            mask &= quantities > 0
+        if intent.min_quantity is not None:
+            mask &= quantities >= intent.min_quantity
+        if intent.max_unit_price is not None:
+            mask &= self._price_np[doc_ids] <= intent.max_unit_price
+        doc_ids = doc_ids[mask]
+        if doc_ids.size == 0:
+            return []
 
-        for doc in self._fallback_docs:
-            haystack = " ".join(
-                [
-                    doc["manufacturer"],
-                    doc["manufacturer_part_number"],
-                    doc["name"],
-                    doc["description"],
-                    " ".join(doc.get("tags", [])),
-                    " ".join(doc.get("use_cases", [])),
-                ]
-            ).lower()
-
-            match_score = sum(token in haystack for token in query_tokens)
-            if query_tokens and match_score == 0:
-                continue
-
-            if intent.in_stock_only and doc["quantity_available"] <= 0:
-                continue
-            if intent.min_quantity is not None and doc["quantity_available"] < intent.min_quantity:
-                continue
-            if intent.max_unit_price is not None and doc["unit_price"] > intent.max_unit_price:
-                continue
-
-            coverage = _keyword_coverage(intent.keywords, doc)
-            recommendation_score = _recommendation_score(1.0, 1.0, doc, coverage)
+        coverage_np = np.fromiter(
+            (_keyword_coverage_tokens(query_tokens, self._fallback_haystacks[doc_id]) for doc_id in doc_ids),
+            dtype=np.float64,
+            count=doc_ids.size,
+        )
+        # Same weights as _recommendation_score with relevance fixed at 1.0.
+        scores_np = np.round(
+            0.78 + (0.15 * coverage_np) + (0.05 * self._stock_np[doc_ids]) + (0.02 * self._price_score_np[doc_ids]),
+            4,
+        )
+        top = np.argsort(-scores_np, kind="stable")[: intent.limit]
+
+        results: list[ProductResult] = []
+        for position in top:
+            doc = self._fallback_docs[doc_ids[position]]
+            recommendation_score = float(scores_np[position])
+            coverage = float(coverage_np[position])
             results.append(
                 ProductResult(
                     id=doc["id"],
@@ -315,20 +468,52 @@ class CatalogService:
                     fit_reason=_build_reason(doc, recommendation_score, coverage),
                 )
             )
+        return results
 
-        results.sort(key=lambda r: r.recommendation_score, reverse=True)
-        return results[: intent.limit]
+    # Args:
+    #   query_tokens: frozenset[str]
+    #     Significant query tokens.
+    # Returns:
+    #   list[int]
+    #     Ascending fallback doc ids containing at least one query token.
+    # Notes:
+    #   Tokens are matched against the posting-list vocabulary by substring,
+    #   preserving the substring semantics of a full haystack scan.
+    def _candidate_ids(self, query_tokens: frozenset[str]) -> list[int]:
+        candidate_ids: set[int] = set()
+        for token in query_tokens:
+            for term, doc_ids in self._postings.items():
+                if token in term:
+                    candidate_ids.update(doc_ids)
+        return sorted(candidate_ids)
 
     # Args:
     #   None
     # Returns:
     #   list[dict[str, Any]]
-    #     Parsed product documents from seed catalog JSON.
+    #     Parsed product documents from the gzip NDJSON seed catalog.
+    # Notes:
+    #   The generator writes spec_blob into each line; it is derived here only
+    #   for documents that lack it, so seeding can index docs as-is.
+    #   Low-cardinality values (vendor, category, package, series) are interned so
+    #   the resident catalog shares one string per distinct value.
     @staticmethod
     def _load_seed_catalog() -> list[dict[str, Any]]:
-        catalog_path = Path(__file__).resolve().parent.parent / "data" / "catalog.json"
-        with catalog_path.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        with gzip.open(_CATALOG_PATH, "rb") as f:
+            docs = [orjson.loads(line) for line in f if line.strip()]
+        intern = sys.intern
+        for doc in docs:
+            doc["manufacturer"] = intern(doc["manufacturer"])
+            doc["category"] = intern(doc["category"])
+            specs = doc.get("key_specs")
+            if isinstance(specs, dict):
+                for key in _INTERNED_SPEC_KEYS:
+                    value = specs.get(key)
+                    if isinstance(value, str):
+                        specs[key] = intern(value)
+            if "spec_blob" not in doc:
+                doc["spec_blob"] = _spec_blob_from_doc(doc)
+        return docs
 
 
 # Args:
@@ -385,38 +570,13 @@ def _build_reason(doc: dict[str, Any], recommendation_score: float, coverage: fl
 
 
 # Args:
-#   query: str
-#     User query text.
 #   doc: dict[str, Any]
-#     Product document to compare against query terms.
+#     Product document with searchable text fields.
 # Returns:
-#   float
-#     Fraction of significant query tokens found in document text fields.
-def _keyword_coverage(query: str, doc: dict[str, Any]) -> float:
-    stop_words = {
-        "find",
-        "need",
-        "with",
-        "that",
-        "this",
-        "for",
-        "the",
-        "and",
-        "top",
-        "best",
-        "under",
-        "in",
-        "stock",
-    }
-    query_tokens = {
-        token.strip(",.?!")
-        for token in query.lower().split()
-        if len(token) > 2 and token.strip(",.?!") not in stop_words
-    }
-    if not query_tokens:
-        return 0.0
-
-    haystack = " ".join(
+#   dict[str, Any]
+#     Lowercased, punctuation-free "lower" haystack string and its "tokens" frozenset.
+def _doc_haystack(doc: dict[str, Any]) -> dict[str, Any]:
+    lower = " ".join(
         [
             doc.get("manufacturer", ""),
             doc.get("manufacturer_part_number", ""),
@@ -425,7 +585,92 @@ def _keyword_coverage(query: str, doc: dict[str, Any]) -> float:
             " ".join(doc.get("tags", [])),
             " ".join(doc.get("use_cases", [])),
         ]
-    ).lower()
+    ).lower().translate(_PUNCT_TRANS)
+    return {"lower": lower, "tokens": frozenset(lower.split())}
+
+
+# Args:
+#   haystacks: list[dict[str, Any]]
+#     Precomputed haystacks indexed by fallback doc id.
+# Returns:
+#   dict[str, list[int]]
+#     Token to ascending doc id posting lists.
+def _build_postings(haystacks: list[dict[str, Any]]) -> dict[str, list[int]]:
+    postings: dict[str, list[int]] = {}
+    for doc_id, haystack in enumerate(haystacks):
+        for token in haystack["tokens"]:
+            postings.setdefault(token, []).append(doc_id)
+    return postings
+
+
+# Args:
+#   query_tokens: frozenset[str]
+#     Significant query tokens.
+#   haystack: dict[str, Any]
+#     Precomputed haystack from _doc_haystack.
+# Returns:
+#   int
+#     Number of query tokens found in the haystack.
+# Notes:
+#   Whole-token hits are set lookups; substring scan only runs for the rest.
+def _count_matched_tokens(query_tokens: frozenset[str], haystack: dict[str, Any]) -> int:
+    doc_tokens = haystack["tokens"]
+    lower = haystack["lower"]
+    return sum(token in doc_tokens or token in lower for token in query_tokens)
+
+
+# Args:
+#   query: str
+#     User query text.
+# Returns:
+#   frozenset[str]
+#     Lowercased, punctuation-free query tokens longer than two characters.
+def _query_tokens(query: str) -> frozenset[str]:
+    return frozenset(
+        token
+        for token in query.lower().translate(_PUNCT_TRANS).split()
+        if len(token) > 2 and token not in _STOP_WORDS
+    )
+
+
+# Args:
+#   query: str
+#     Raw search phrase (in rules mode, the user's whole message).
+# Returns:
+#   str | None
+#     First significant query token shaped like a part number, else None.
+# Notes:
+#   Requires a digit or "-" on top of the _query_tokens filter, so words such as
+#   "I" or "noise" never become a part-number prefix clause.
+def _mpn_prefix_token(query: str) -> str | None:
+    significant = _query_tokens(query)
+    for token in query.lower().translate(_PUNCT_TRANS).split():
+        if token in significant and ("-" in token or any(ch.isdigit() for ch in token)):
+            return token
+    return None
 
-    matched = sum(token in haystack for token in query_tokens)
-    return matched / len(query_tokens)
+
+# Args:
+#   query_tokens: frozenset[str]
+#     Significant query tokens parsed once per request.
+#   haystack: dict[str, Any]
+#     Precomputed haystack from _doc_haystack.
+# Returns:
+#   float
+#     Fraction of query tokens found in the haystack.
+def _keyword_coverage_tokens(query_tokens: frozenset[str], haystack: dict[str, Any]) -> float:
+    if not query_tokens:
+        return 0.0
+    return _count_matched_tokens(query_tokens, haystack) / len(query_tokens)
+
+
+# Args:
+#   query: str
+#     User query text.
+#   doc: dict[str, Any]
+#     Product document to compare against query terms.
+# Returns:
+#   float
+#     Fraction of significant query tokens found in document text fields.
+def _keyword_coverage(query: str, doc: dict[str, Any]) -> float:
+    return _keyword_coverage_tokens(_query_tokens(query), _doc_haystack(doc))
@@ -7,13 +7,17 @@ Author: Paul Harvener
 API entrypoint for the DigiKey AI demo web application.
 """
 
+import hashlib
 from contextlib import asynccontextmanager
 from pathlib import Path
 
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.ai_assistant import QueryInterpreter
@@ -33,6 +37,15 @@ load_dotenv()
 catalog = CatalogService()
 interpreter = QueryInterpreter()
 
+_RELAXED_INTENT_FIELDS = {
+    "in_stock_only": False,
+    "min_quantity": None,
+    "max_unit_price": None,
+    "sort_preference": "relevance",
+}
+_SEARCH_CACHE_CONTROL = "public, max-age=30"
+_search_response_cache: TTLCache = TTLCache(maxsize=256, ttl=30)
+
 
 # Args:
 #   _: FastAPI
@@ -42,12 +55,18 @@ interpreter = QueryInterpreter()
 #     Startup/shutdown lifecycle manager that initializes catalog state.
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    startup_warning = catalog.initialize()
+    startup_warning = await catalog.initialize()
     app.state.startup_warning = startup_warning
     yield
+    await catalog.close()
 
 
-app = FastAPI(title="DigiKey AI Equipment Advisor", version="0.2.0", lifespan=lifespan)
+app = FastAPI(
+    title="DigiKey AI Equipment Advisor",
+    version="0.2.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,28 +83,19 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
 # Args:
-#   item: DirectSearchProduct
-#     Product payload from direct search endpoint flow.
-#   rank: int
-#     Zero-based position of the result in returned list.
+#   query: str
+#     Query phrase used for mock/elasticsearch search.
+#   limit: int
+#     Maximum results requested.
 # Returns:
-#   ProductResult
-#     Normalized ProductResult used by chat response rendering/summarization.
-def _direct_to_product_result(item: DirectSearchProduct, rank: int) -> ProductResult:
-    return ProductResult(
-        id=item.id or item.manufacturer_part_number or f"product-{rank}",
-        manufacturer=item.manufacturer,
-        manufacturer_part_number=item.manufacturer_part_number,
-        name=item.name,
-        description=item.description,
-        category=item.category,
-        unit_price=float(item.unit_price) if item.unit_price is not None else 0.0,
-        quantity_available=int(item.quantity_available) if item.quantity_available is not None else 0,
-        product_url=item.product_url or "",
-        datasheet_url=item.datasheet_url or "",
-        recommendation_score=float(item.recommendation_score) if item.recommendation_score is not None else 0.75,
-        fit_reason=item.fit_reason or "Result sourced from mock catalog.",
-    )
+#   tuple[list[ProductResult], str | None]
+#     Ranked catalog products and optional warning.
+# Notes:
+#   Constraints are relaxed here; callers apply user constraints afterwards.
+#   query/limit come from validated request models, so intent validation is skipped.
+async def _query_products(query: str, limit: int) -> tuple[list[ProductResult], str | None]:
+    intent = QueryIntent.model_construct(keywords=query, limit=limit, **_RELAXED_INTENT_FIELDS)
+    return await catalog.search(intent)
 
 
 # Args:
@@ -96,18 +106,12 @@ def _direct_to_product_result(item: DirectSearchProduct, rank: int) -> ProductRe
 # Returns:
 #   tuple[list[DirectSearchProduct], str | None]
 #     Mock catalog products normalized into DirectSearchProduct and optional warning.
-def _query_mock_products(query: str, limit: int) -> tuple[list[DirectSearchProduct], str | None]:
-    intent = QueryIntent(
-        keywords=query,
-        limit=limit,
-        in_stock_only=False,
-        min_quantity=None,
-        max_unit_price=None,
-        sort_preference="relevance",
-    )
-    fallback_products, fallback_warning = catalog.search(intent)
+# Notes:
+#   Catalog results are already-validated ProductResult objects, so mapping skips validation.
+async def _query_mock_products(query: str, limit: int) -> tuple[list[DirectSearchProduct], str | None]:
+    fallback_products, fallback_warning = await _query_products(query, limit)
     mapped = [
-        DirectSearchProduct(
+        DirectSearchProduct.model_construct(
             id=product.id,
             manufacturer=product.manufacturer,
             manufacturer_part_number=product.manufacturer_part_number,
@@ -135,14 +139,39 @@ def _query_mock_products(query: str, limit: int) -> tuple[list[DirectSearchProdu
 #   list[ProductResult]
 #     Filtered products honoring stock/quantity/price constraints.
 def _apply_intent_constraints(products: list[ProductResult], intent: QueryIntent) -> list[ProductResult]:
-    filtered = products
-    if intent.in_stock_only:
-        filtered = [p for p in filtered if (p.quantity_available or 0) > 0]
-    if intent.min_quantity is not None:
-        filtered = [p for p in filtered if (p.quantity_available or 0) >= intent.min_quantity]
-    if intent.max_unit_price is not None:
-        filtered = [p for p in filtered if (p.unit_price or 0.0) <= intent.max_unit_price]
-    return filtered[: intent.limit]
+    in_stock_only = intent.in_stock_only
+    min_quantity = intent.min_quantity
+    max_unit_price = intent.max_unit_price
+    limit = intent.limit
+
+    filtered: list[ProductResult] = []
+    for product in products:
+        if len(filtered) >= limit:
+            break
+        quantity = product.quantity_available or 0
+        if in_stock_only and quantity <= 0:
+            continue
+        if min_quantity is not None and quantity < min_quantity:
+            continue
+        if max_unit_price is not None and (product.unit_price or 0.0) > max_unit_price:
+            continue
+        filtered.append(product)
+    return filtered
+
+
+# Args:
+#   if_none_match: str | None
+#     Raw If-None-Match request header.
+#   etag: str
+#     Quoted strong ETag of the current response body.
+# Returns:
+#   bool
+#     True when the client's cached copy is still current.
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 
 # Args:
@@ -173,15 +202,15 @@ def health() -> dict[str, str]:
 #     Interpreted intent, ranked products, summary answer, and optional warnings.
 # Notes:
 #   This endpoint runs AI-assisted intent parsing and queries the mock catalog.
+#   Intent parsing may block on the OpenAI HTTP call, so it runs in the threadpool.
 @app.post("/api/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
-    intent = interpreter.interpret(request.message)
-    direct_products, query_warning = _query_mock_products(
+async def chat(request: ChatRequest) -> ChatResponse:
+    intent = await run_in_threadpool(interpreter.interpret, request.message)
+    products, query_warning = await _query_products(
         query=intent.keywords,
         limit=intent.limit,
     )
     source_label = "mock_catalog"
-    products = [_direct_to_product_result(item, idx) for idx, item in enumerate(direct_products)]
     products = _apply_intent_constraints(products, intent)
     answer = interpreter.summarize(intent, products, source_label)
 
@@ -203,20 +232,40 @@ def chat(request: ChatRequest) -> ChatResponse:
 # Args:
 #   request: DirectSearchRequest
 #     Header search query and requested result limit.
+#   http_request: Request
+#     Raw request used to read conditional-request headers.
 # Returns:
-#   DirectSearchResponse
-#     Mock-catalog search results with optional warning context.
+#   Response
+#     Serialized DirectSearchResponse, or an empty 412 when If-None-Match matches.
 # Notes:
 #   This endpoint powers the top header search bar for direct catalog lookup.
+#   Serialized bodies and their ETags are cached briefly per (query, limit), except
+#   degraded fallback bodies after an Elasticsearch failure, so the next request retries it.
+#   RFC 9110 13.1.2: a true If-None-Match on a POST yields 412, not 304; the client
+#   keeps using its copy for that ETag.
 @app.post("/api/digikey-search", response_model=DirectSearchResponse)
-def digikey_search(request: DirectSearchRequest) -> DirectSearchResponse:
-    products, warning = _query_mock_products(
-        query=request.query,
-        limit=request.limit,
-    )
-    return DirectSearchResponse(
-        source="mock_catalog",
-        query=request.query,
-        products=products,
-        warning=warning,
-    )
+async def digikey_search(request: DirectSearchRequest, http_request: Request) -> Response:
+    cache_key = (request.query, request.limit)
+    cached = _search_response_cache.get(cache_key)
+    if cached is None:
+        products, warning = await _query_mock_products(
+            query=request.query,
+            limit=request.limit,
+        )
+        response = DirectSearchResponse(
+            source="mock_catalog",
+            query=request.query,
+            products=products,
+            warning=warning,
+        )
+        body = orjson.dumps(response.model_dump())
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        cached = (body, etag)
+        if warning is None or catalog.mode != "elasticsearch":
+            _search_response_cache[cache_key] = cached
+
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": _SEARCH_CACHE_CONTROL}
+    if _etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=412, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -7,12 +7,29 @@ Author: Paul Harvener
 Catalog generator for creating deterministic mock DigiKey-style product data.
 """
 
+import gzip
+import itertools
 import json
-import random
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 TARGET_COUNT = 5000
-RNG = random.Random(42)
+_CATALOG_PATH = Path(__file__).resolve().parent.parent / "data" / "catalog.ndjson.gz"
+SEED = 42
+# Generated products are drawn in fixed-size chunks, each from its own RNG seeded
+# with (SEED, chunk_id), so output does not depend on how many workers run.
+GENERATION_CHUNK_SIZE = 1000
 
 VENDORS = [
     "Raspberry Pi",
@@ -239,29 +256,103 @@ ADJECTIVES = [
 
 PACKAGE_HINTS = ["SMD", "THT", "Module", "Board", "Kit", "Cable", "Assembly"]
 
+PRODUCT_URL_PREFIX = "https://www.digikey.com/en/products/detail/"
+DATASHEET_URL_PREFIX = "https://datasheets.example.com/"
+
+# Loop invariants hoisted out of the per-product path.
+_ALNUM_RE = re.compile(r"[^A-Z0-9]")
+_VENDOR_SLUG = {vendor: vendor.lower().replace(" ", "-").replace(".", "") for vendor in VENDORS}
+_VENDOR_PREFIX = {vendor: _ALNUM_RE.sub("", vendor.upper())[:4] or "PART" for vendor in VENDORS}
+_CAT_IS_PI = [category["name"].startswith(("Raspberry Pi", "Single Board")) for category in CATEGORIES]
+_CAT_TOKENS = [tuple(category["tokens"]) for category in CATEGORIES]
+_CAT_SERIES_LOWER = [[series.lower() for series in category["series"]] for category in CATEGORIES]
+_PACKAGE_LOWER = {package: package.lower() for package in PACKAGE_HINTS}
+
+
+@dataclass(slots=True)
+class Product:
+    id: str
+    manufacturer: str
+    manufacturer_part_number: str
+    name: str
+    description: str
+    category: str
+    unit_price: float
+    quantity_available: int
+    tags: list[str]
+    use_cases: list[str]
+    key_specs: dict[str, str]
+    product_url: str
+    datasheet_url: str
+    spec_blob: str = field(init=False)
+
+    # Args:
+    #   None
+    # Returns:
+    #   None
+    # Notes:
+    #   Flattens key_specs into the searchable spec_blob indexed by Elasticsearch,
+    #   so the seeder can send catalog lines as-is.
+    def __post_init__(self) -> None:
+        self.spec_blob = " ".join(f"{key} {value}" for key, value in self.key_specs.items())
+
 
 # Args:
-#   low: float
-#     Lower bound for random price generation.
-#   high: float
-#     Upper bound for random price generation.
+#   rng: np.random.Generator
+#     Random stream to draw from.
+#   sizes: np.ndarray
+#     Per-row population size (length of the list being sampled).
+#   k: int
+#     Number of distinct indices to draw per row.
 # Returns:
-#   float
-#     Rounded unit price.
-def money(low: float, high: float) -> float:
-    return round(RNG.uniform(low, high), 2)
+#   np.ndarray
+#     (rows, k) array of distinct indices, each row sampled without replacement.
+# Notes:
+#   Ranks random keys per row, masking positions past that row's population size.
+def sample_indices(rng: np.random.Generator, sizes: np.ndarray, k: int) -> np.ndarray:
+    keys = rng.random((len(sizes), int(sizes.max())))
+    keys[np.arange(keys.shape[1]) >= sizes[:, None]] = np.inf
+    return np.argsort(keys, axis=1)[:, :k]
 
 
 # Args:
-#   low: int
-#     Minimum stock quantity.
-#   high: int
-#     Maximum stock quantity.
+#   rng: np.random.Generator
+#     Random stream to draw from.
+#   start: int
+#     Position of the first product; position i belongs to CATEGORIES[i % len(CATEGORIES)].
+#   count: int
+#     Number of generated products.
 # Returns:
-#   int
-#     Random stock quantity.
-def stock(low: int, high: int) -> int:
-    return RNG.randint(low, high)
+#   dict[str, list]
+#     Per-product columns: numeric fields plus choice/sample indices into the category lists.
+# Notes:
+#   Draws every column in one vectorized call instead of one RNG call per product.
+def draw_columns(rng: np.random.Generator, start: int, count: int) -> dict[str, list]:
+    cat_positions = np.arange(start, start + count) % len(CATEGORIES)
+    price_bounds = np.array([category["price"] for category in CATEGORIES], dtype=np.float64)[cat_positions]
+    stock_bounds = np.array([category["stock"] for category in CATEGORIES], dtype=np.int64)[cat_positions]
+    series_sizes = np.array([len(category["series"]) for category in CATEGORIES])[cat_positions]
+    token_sizes = np.array([len(category["tokens"]) for category in CATEGORIES])[cat_positions]
+    use_case_sizes = np.array([len(category["use_cases"]) for category in CATEGORIES])[cat_positions]
+
+    columns = {
+        "vendor": rng.integers(0, len(VENDORS), size=count),
+        "pi_roll": rng.random(count),
+        "series": rng.integers(0, series_sizes),
+        "adjective": rng.integers(0, len(ADJECTIVES), size=count),
+        "package": rng.integers(0, len(PACKAGE_HINTS), size=count),
+        "tokens": sample_indices(rng, token_sizes, 2),
+        "description_use_case": rng.integers(0, use_case_sizes),
+        "use_cases": sample_indices(rng, use_case_sizes, 2),
+        "unit_price": rng.uniform(price_bounds[:, 0], price_bounds[:, 1]).round(2),
+        "quantity_available": rng.integers(stock_bounds[:, 0], stock_bounds[:, 1] + 1),
+        "temp_low": -40 + rng.integers(0, 21, size=count),
+        "temp_high": 85 + rng.integers(0, 41, size=count),
+        "revision_major": rng.integers(1, 6, size=count),
+        "revision_minor": rng.integers(0, 10, size=count),
+        "part_suffix": rng.integers(10, 100, size=count),
+    }
+    return {name: values.tolist() for name, values in columns.items()}
 
 
 # Args:
@@ -271,12 +362,14 @@ def stock(low: int, high: int) -> int:
 #     Category index used for deterministic grouping.
 #   item_index: int
 #     Per-item sequence number.
+#   suffix: int
+#     Pre-drawn two-digit part number suffix.
 # Returns:
 #   str
 #     Synthetic manufacturer part number.
-def make_part_number(vendor: str, cat_index: int, item_index: int) -> str:
-    prefix = "".join(ch for ch in vendor.upper() if ch.isalnum())[:4] or "PART"
-    return f"{prefix}-{cat_index:02d}{item_index:04d}-{RNG.randint(10,99)}"
+def make_part_number(vendor: str, cat_index: int, item_index: int, suffix: int) -> str:
+    prefix = _VENDOR_PREFIX.get(vendor) or _ALNUM_RE.sub("", vendor.upper())[:4] or "PART"
+    return f"{prefix}-{cat_index:02d}{item_index:04d}-{suffix}"
 
 
 # Args:
@@ -288,105 +381,183 @@ def make_part_number(vendor: str, cat_index: int, item_index: int) -> str:
 #     Category sequence number.
 #   item_index: int
 #     Product sequence number.
+#   columns: dict[str, list]
+#     Pre-drawn per-product columns from draw_columns.
+#   position: int
+#     Row of this product in the columns.
 # Returns:
-#   dict
+#   Product
 #     Fully-formed catalog document for one synthetic product.
 # Notes:
-#   Produces deterministic pseudo-random values via RNG seed.
-def make_product(vendor: str, category: dict, cat_index: int, item_index: int) -> dict:
-    series = RNG.choice(category["series"])
-    adjective = RNG.choice(ADJECTIVES)
-    package = RNG.choice(PACKAGE_HINTS)
-    token_hint = ", ".join(RNG.sample(category["tokens"], k=min(2, len(category["tokens"]))))
-
-    part_number = make_part_number(vendor, cat_index, item_index)
+#   Produces deterministic pseudo-random values via RNG seed; no RNG calls happen here.
+def make_product(
+    vendor: str,
+    category: dict,
+    cat_index: int,
+    item_index: int,
+    columns: dict[str, list],
+    position: int,
+) -> Product:
+    series_index = columns["series"][position]
+    series = category["series"][series_index]
+    adjective = ADJECTIVES[columns["adjective"][position]]
+    package = PACKAGE_HINTS[columns["package"][position]]
+    token_hint = ", ".join(category["tokens"][idx] for idx in columns["tokens"][position])
+    use_case = category["use_cases"][columns["description_use_case"][position]]
+
+    part_number = make_part_number(vendor, cat_index, item_index, columns["part_suffix"][position])
     name = f"{adjective} {series} {package}"
     description = (
-        f"{name} from {vendor} for {RNG.choice(category['use_cases'])}. "
+        f"{name} from {vendor} for {use_case}. "
         f"Optimized for {token_hint} applications and long lifecycle deployments."
     )
 
+    # Ordered dedupe (not a set) so tag order does not depend on PYTHONHASHSEED.
+    tags = dict.fromkeys(
+        (*_CAT_TOKENS[cat_index - 1], _CAT_SERIES_LOWER[cat_index - 1][series_index], _PACKAGE_LOWER[package])
+    )
     product_slug = part_number.lower().replace("/", "-")
-    vendor_slug = vendor.lower().replace(" ", "-").replace(".", "")
-
-    return {
-        "id": f"mock-{cat_index:02d}-{item_index:04d}",
-        "manufacturer": vendor,
-        "manufacturer_part_number": part_number,
-        "name": name,
-        "description": description,
-        "category": category["name"],
-        "unit_price": money(*category["price"]),
-        "quantity_available": stock(*category["stock"]),
-        "tags": list({*category["tokens"], series.lower(), package.lower()}),
-        "use_cases": RNG.sample(category["use_cases"], k=min(2, len(category["use_cases"]))),
-        "key_specs": {
+    vendor_slug = _VENDOR_SLUG[vendor]
+
+    return Product(
+        id=f"mock-{cat_index:02d}-{item_index:04d}",
+        manufacturer=vendor,
+        manufacturer_part_number=part_number,
+        name=name,
+        description=description,
+        category=category["name"],
+        unit_price=columns["unit_price"][position],
+        quantity_available=columns["quantity_available"][position],
+        tags=list(tags),
+        use_cases=[category["use_cases"][idx] for idx in columns["use_cases"][position]],
+        key_specs={
             "series": series,
             "package": package,
-            "temperature": f"{-40 + RNG.randint(0, 20)}C to {85 + RNG.randint(0, 40)}C",
-            "revision": f"R{RNG.randint(1,5)}.{RNG.randint(0,9)}",
+            "temperature": f"{columns['temp_low'][position]}C to {columns['temp_high'][position]}C",
+            "revision": f"R{columns['revision_major'][position]}.{columns['revision_minor'][position]}",
         },
-        "product_url": f"https://www.digikey.com/en/products/detail/{vendor_slug}/{product_slug}/",
-        "datasheet_url": f"https://datasheets.example.com/{product_slug}.pdf",
-    }
+        product_url=PRODUCT_URL_PREFIX + vendor_slug + "/" + product_slug + "/",
+        datasheet_url=DATASHEET_URL_PREFIX + product_slug + ".pdf",
+    )
 
 
 # Args:
-#   None
+#   rng: np.random.Generator
+#     Random stream to draw from.
 # Returns:
-#   list[dict]
+#   list[Product]
 #     Curated Raspberry Pi board and accessory records.
-def raspberry_pi_overrides() -> list[dict]:
+def raspberry_pi_overrides(rng: np.random.Generator) -> list[Product]:
+    interfaces = ["USB-C", "CSI", "HDMI", "GPIO", "PCIe"]
+    generations = ["Pi 4", "Pi 5", "CM4", "Zero"]
+    count = len(RASPBERRY_PRODUCTS)
+    part_suffixes = rng.integers(10, 100, size=count).tolist()
+    prices = rng.uniform(9.0, 165.0, size=count).round(2).tolist()
+    quantities = rng.integers(50, 9001, size=count).tolist()
+    interface_indices = rng.integers(0, len(interfaces), size=count).tolist()
+    generation_indices = rng.integers(0, len(generations), size=count).tolist()
+
     docs = []
     for idx, (name, description, suffix) in enumerate(RASPBERRY_PRODUCTS, start=1):
-        part = f"RPI-{suffix}-{RNG.randint(10,99)}"
+        row = idx - 1
+        part = f"RPI-{suffix}-{part_suffixes[row]}"
+        part_slug = part.lower()
         docs.append(
-            {
-                "id": f"rpi-featured-{idx:03d}",
-                "manufacturer": "Raspberry Pi",
-                "manufacturer_part_number": part,
-                "name": name,
-                "description": description,
-                "category": "Single Board Computers (SBC)" if "Pi" in name or "Compute" in name else "Raspberry Pi Accessories",
-                "unit_price": round(RNG.uniform(9.0, 165.0), 2),
-                "quantity_available": RNG.randint(50, 9000),
-                "tags": ["raspberry pi", "accessory", "iot", "embedded"],
-                "use_cases": ["maker", "education", "edge ai"],
-                "key_specs": {
-                    "interface": RNG.choice(["USB-C", "CSI", "HDMI", "GPIO", "PCIe"]),
-                    "generation": RNG.choice(["Pi 4", "Pi 5", "CM4", "Zero"]),
+            Product(
+                id=f"rpi-featured-{idx:03d}",
+                manufacturer="Raspberry Pi",
+                manufacturer_part_number=part,
+                name=name,
+                description=description,
+                category="Single Board Computers (SBC)" if "Pi" in name or "Compute" in name else "Raspberry Pi Accessories",
+                unit_price=prices[row],
+                quantity_available=quantities[row],
+                tags=["raspberry pi", "accessory", "iot", "embedded"],
+                use_cases=["maker", "education", "edge ai"],
+                key_specs={
+                    "interface": interfaces[interface_indices[row]],
+                    "generation": generations[generation_indices[row]],
                     "status": "Active",
                 },
-                "product_url": f"https://www.digikey.com/en/products/detail/raspberry-pi/{part.lower()}/",
-                "datasheet_url": f"https://datasheets.example.com/raspberry-pi/{part.lower()}.pdf",
-            }
+                product_url=PRODUCT_URL_PREFIX + "raspberry-pi/" + part_slug + "/",
+                datasheet_url=DATASHEET_URL_PREFIX + "raspberry-pi/" + part_slug + ".pdf",
+            )
         )
     return docs
 
 
 # Args:
-#   None
+#   chunk_id: int
+#     Chunk number, mixed into the chunk's RNG seed.
+#   start: int
+#     Position of the chunk's first generated product.
+#   count: int
+#     Number of products in the chunk.
 # Returns:
-#   list[dict]
-#     Complete catalog list sized to TARGET_COUNT.
+#   list[Product]
+#     Generated products for positions start..start+count-1.
+# Notes:
+#   Module-level and self-contained so ProcessPoolExecutor workers can run it.
+def generate_chunk(chunk_id: int, start: int, count: int) -> list[Product]:
+    rng = np.random.default_rng([SEED, chunk_id])
+    columns = draw_columns(rng, start, count)
+    vendor_indices = columns["vendor"]
+    pi_rolls = columns["pi_roll"]
+
+    # Rotate through categories starting where this chunk falls in the cycle.
+    cat_cycle = itertools.islice(itertools.cycle(enumerate(CATEGORIES, start=1)), start % len(CATEGORIES), None)
+    return [
+        make_product(
+            "Raspberry Pi" if _CAT_IS_PI[cat_index - 1] and pi_rolls[row] < 0.55 else VENDORS[vendor_indices[row]],
+            category,
+            cat_index,
+            start + row + 1,
+            columns,
+            row,
+        )
+        for row, (cat_index, category) in zip(range(count), cat_cycle)
+    ]
+
+
+# Args:
+#   workers: int
+#     Worker processes for generated chunks; 1 generates in-process.
+# Returns:
+#   Iterator[Product]
+#     Catalog documents, exactly TARGET_COUNT of them, yielded one at a time.
 # Notes:
 #   Blends curated Raspberry Pi entries with generated category coverage.
-def build_catalog() -> list[dict]:
-    docs: list[dict] = raspberry_pi_overrides()
+#   Output is identical for any worker count.
+def iter_catalog(workers: int = 1) -> Iterator[Product]:
+    overrides = raspberry_pi_overrides(np.random.default_rng(SEED))[:TARGET_COUNT]
+    yield from overrides
+    generated = TARGET_COUNT - len(overrides)
+
+    starts = list(range(0, generated, GENERATION_CHUNK_SIZE))
+    chunk_ids = list(range(len(starts)))
+    counts = [min(GENERATION_CHUNK_SIZE, generated - start) for start in starts]
+    if workers <= 1:
+        for chunk_id, start, count in zip(chunk_ids, starts, counts):
+            yield from generate_chunk(chunk_id, start, count)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for docs in pool.map(generate_chunk, chunk_ids, starts, counts):
+            yield from docs
 
-    item_index = 1
-    while len(docs) < TARGET_COUNT:
-        for cat_index, category in enumerate(CATEGORIES, start=1):
-            vendor = RNG.choice(VENDORS)
-            if category["name"].startswith("Raspberry Pi") or category["name"].startswith("Single Board"):
-                if RNG.random() < 0.55:
-                    vendor = "Raspberry Pi"
-            docs.append(make_product(vendor, category, cat_index, item_index))
-            item_index += 1
-            if len(docs) >= TARGET_COUNT:
-                break
 
-    return docs[:TARGET_COUNT]
+# Args:
+#   doc: Product
+#     Catalog document.
+# Returns:
+#   bytes
+#     Compact JSON encoding of the document.
+# Notes:
+#   orjson encodes slotted dataclasses natively; the stdlib path goes through asdict
+#   with orjson's compact separators and raw UTF-8 so both paths emit identical bytes.
+def dumps_doc(doc: Product) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(doc)
+    return json.dumps(asdict(doc), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
 
 # Args:
@@ -394,12 +565,21 @@ def build_catalog() -> list[dict]:
 # Returns:
 #   None
 # Notes:
-#   Writes JSON output to data/catalog.json for Elasticsearch seeding.
+#   Streams gzip-compressed NDJSON (one document per line) to data/catalog.ndjson.gz.
+#   Level 1 keeps compression cheap; mtime=0 plus hash-independent tag order keeps
+#   the output byte-identical across runs, hash seeds and worker start methods.
+#   Uses orjson when installed and falls back to the stdlib json encoder.
+#   CATALOG_GENERATOR_WORKERS sets the process count (default 1).
 def main() -> None:
-    target_path = Path(__file__).resolve().parent.parent / "data" / "catalog.json"
-    catalog = build_catalog()
-    target_path.write_text(json.dumps(catalog, indent=2) + "\n", encoding="utf-8")
-    print(f"Wrote {len(catalog)} products to {target_path}")
+    target_path = _CATALOG_PATH
+    workers = int(os.getenv("CATALOG_GENERATOR_WORKERS", "1"))
+    count = 0
+    with gzip.GzipFile(target_path, "wb", compresslevel=1, mtime=0) as f:
+        for doc in iter_catalog(workers):
+            f.write(dumps_doc(doc))
+            f.write(b"\n")
+            count += 1
+    print(f"Wrote {count} products to {target_path}")
 
 
 if __name__ == "__main__":
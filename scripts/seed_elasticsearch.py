@@ -7,14 +7,27 @@ Author: Paul Harvener
 Seeder script that prepares Elasticsearch index mapping and loads mock catalog data.
 """
 
+import gzip
 import json
 import os
+import re
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Iterator
 
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import BadRequestError, Elasticsearch
 
 
+_CATALOG_PATH = Path(__file__).resolve().parent.parent / "data" / "catalog.ndjson.gz"
+# Catalog documents are written with "id" as their first key.
+_DOC_ID_RE = re.compile(rb'"id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+RETRY_ATTEMPTS = 20
+RETRY_BASE_SECONDS = 0.2
+RETRY_MAX_SECONDS = 5.0
+
 MAPPING = {
     "mappings": {
         "properties": {
@@ -48,6 +61,7 @@ def main() -> None:
     username = os.getenv("ELASTICSEARCH_USERNAME") or None
     password = os.getenv("ELASTICSEARCH_PASSWORD") or None
     recreate = os.getenv("ELASTICSEARCH_SEED_RECREATE", "false").lower() == "true"
+    chunk_size = int(os.getenv("ELASTICSEARCH_BULK_CHUNK_SIZE", "500"))
 
     auth = (username, password) if username and password else None
     client = Elasticsearch(es_url, basic_auth=auth, request_timeout=20)
@@ -55,32 +69,134 @@ def main() -> None:
     wait_for_elasticsearch(client)
     wait_for_query_ready(client)
 
-    if recreate and call_with_retries(lambda: client.indices.exists(index=index_name)):
-        print(f"Deleting existing index: {index_name}")
-        call_with_retries(lambda: client.indices.delete(index=index_name))
+    if recreate:
+        deleted = call_with_retries(client.options(ignore_status=[404]).indices.delete, index=index_name)
+        if deleted.meta.status != 404:
+            print(f"Deleted existing index: {index_name}")
 
-    if not call_with_retries(lambda: client.indices.exists(index=index_name)):
-        print(f"Creating index: {index_name}")
-        call_with_retries(lambda: client.indices.create(index=index_name, **MAPPING))
+    if create_index(client, index_name):
+        print(f"Created index: {index_name}")
+    else:
+        existing = call_with_retries(client.count, index=index_name).get("count", 0)
+        if existing > 0 and not recreate:
+            print(f"Index already has {existing} docs. Skipping seed.")
+            return
 
-    existing = call_with_retries(lambda: client.count(index=index_name)).get("count", 0)
-    if existing > 0 and not recreate:
-        print(f"Index already has {existing} docs. Skipping seed.")
-        return
+    call_with_retries(bulk_index, client, index_name, chunk_size=chunk_size)
 
-    docs = load_catalog_docs()
-    actions = []
-    for doc in docs:
-        source = dict(doc)
-        source["spec_blob"] = spec_blob(source)
-        actions.append({"_index": index_name, "_id": source["id"], "_source": source})
+    call_with_retries(client.indices.refresh, index=index_name)
+    final_count = call_with_retries(client.count, index=index_name).get("count", 0)
+    print(f"Seed complete. Indexed {final_count} documents into {index_name}.")
 
-    if actions:
-        call_with_retries(lambda: helpers.bulk(client, actions))
 
-    call_with_retries(lambda: client.indices.refresh(index=index_name))
-    final_count = call_with_retries(lambda: client.count(index=index_name)).get("count", 0)
-    print(f"Seed complete. Indexed {final_count} documents into {index_name}.")
+# Args:
+#   client: Elasticsearch
+#     Initialized Elasticsearch client.
+#   index_name: str
+#     Index to create with MAPPING.
+# Returns:
+#   bool
+#     True when the index was created, False when it already existed.
+# Raises:
+#   BadRequestError
+#     If the create request fails for any reason other than an existing index.
+# Notes:
+#   One round-trip replaces the exists check; a 400 resource_already_exists_exception
+#   means the index is already there.
+def create_index(client: Elasticsearch, index_name: str) -> bool:
+    response = call_with_retries(client.options(ignore_status=[400]).indices.create, index=index_name, **MAPPING)
+    if response.meta.status != 400:
+        return True
+    error = response.body.get("error", {}) if isinstance(response.body, dict) else {}
+    if isinstance(error, dict) and error.get("type") == "resource_already_exists_exception":
+        return False
+    raise BadRequestError(message=str(error), meta=response.meta, body=response.body)
+
+
+# Args:
+#   index_name: str
+#     Target Elasticsearch index.
+#   chunk_size: int
+#     Documents per bulk request body.
+# Returns:
+#   Iterator[bytes]
+#     Ready-to-send NDJSON _bulk bodies of up to chunk_size index operations.
+# Notes:
+#   Catalog lines already carry spec_blob and are forwarded without decoding;
+#   only the leading "id" value is pulled out with a regex for the action line.
+def iter_bulk_bodies(index_name: str, chunk_size: int) -> Iterator[bytes]:
+    action_prefix = b'{"index":{"_index":' + json.dumps(index_name).encode("utf-8") + b',"_id":"'
+    body = bytearray()
+    count = 0
+    for line in iter_catalog_lines():
+        match = _DOC_ID_RE.search(line)
+        if match:
+            doc_id = match.group(1)
+        else:
+            doc_id = json.dumps(json.loads(line)["id"]).encode("utf-8")[1:-1]
+        body += action_prefix
+        body += doc_id
+        body += b'"}}\n'
+        body += line
+        body += b"\n"
+        count += 1
+        if count == chunk_size:
+            yield bytes(body)
+            body = bytearray()
+            count = 0
+    if count:
+        yield bytes(body)
+
+
+# Args:
+#   client: Elasticsearch
+#     Initialized Elasticsearch client.
+#   body: bytes
+#     NDJSON _bulk request body.
+# Returns:
+#   int
+#     Number of documents indexed by this request.
+# Raises:
+#   RuntimeError
+#     If any document in the request fails to index.
+def send_bulk_body(client: Elasticsearch, body: bytes) -> int:
+    response = client.bulk(operations=body)
+    items = response["items"]
+    if response.get("errors"):
+        failed = [item["index"] for item in items if item.get("index", {}).get("status", 500) >= 300]
+        raise RuntimeError(f"{len(failed)} documents failed to index; first error: {failed[0].get('error')}")
+    return len(items)
+
+
+# Args:
+#   client: Elasticsearch
+#     Initialized Elasticsearch client.
+#   index_name: str
+#     Target Elasticsearch index.
+#   chunk_size: int
+#     Documents per bulk request.
+#   thread_count: int
+#     Concurrent bulk request workers.
+# Returns:
+#   int
+#     Number of documents indexed.
+# Raises:
+#   RuntimeError
+#     If any document fails to index.
+# Notes:
+#   Keeps at most 2 * thread_count bodies in flight. Builds a fresh body stream per
+#   call so call_with_retries can rerun it safely; re-indexing by _id is idempotent.
+def bulk_index(client: Elasticsearch, index_name: str, chunk_size: int = 500, thread_count: int = 4) -> int:
+    indexed = 0
+    pending: deque[Future[int]] = deque()
+    with ThreadPoolExecutor(max_workers=thread_count) as pool:
+        for body in iter_bulk_bodies(index_name, chunk_size):
+            pending.append(pool.submit(send_bulk_body, client, body))
+            if len(pending) >= thread_count * 2:
+                indexed += pending.popleft().result()
+        while pending:
+            indexed += pending.popleft().result()
+    return indexed
 
 
 # Args:
@@ -88,23 +204,36 @@ def main() -> None:
 #     Initialized Elasticsearch client.
 #   attempts: int
 #     Maximum ping attempts.
-#   sleep_seconds: float
-#     Delay between attempts.
+#   initial_delay: float
+#     Delay after the first failed attempt.
+#   max_delay: float
+#     Upper bound for the growing delay between attempts.
 # Returns:
 #   None
 # Raises:
 #   RuntimeError
 #     If Elasticsearch cannot be reached after retries.
-def wait_for_elasticsearch(client: Elasticsearch, attempts: int = 60, sleep_seconds: float = 2.0) -> None:
+# Notes:
+#   Each ping uses a 0.5 s request timeout instead of the client's 20 s default,
+#   and the delay grows by 1.5x per attempt so a fast-booting node is seen quickly.
+def wait_for_elasticsearch(
+    client: Elasticsearch,
+    attempts: int = 60,
+    initial_delay: float = 0.1,
+    max_delay: float = 2.0,
+) -> None:
+    ping_client = client.options(request_timeout=0.5)
+    delay = initial_delay
     for attempt in range(1, attempts + 1):
         try:
-            if client.ping():
+            if ping_client.ping():
                 print("Elasticsearch is reachable.")
                 return
         except Exception:
             pass
         print(f"Waiting for Elasticsearch... ({attempt}/{attempts})")
-        time.sleep(sleep_seconds)
+        time.sleep(delay)
+        delay = min(max_delay, delay * 1.5)
 
     raise RuntimeError("Elasticsearch did not become available in time")
 
@@ -114,14 +243,25 @@ def wait_for_elasticsearch(client: Elasticsearch, attempts: int = 60, sleep_seco
 #     Initialized Elasticsearch client.
 #   attempts: int
 #     Maximum readiness attempts.
-#   sleep_seconds: float
-#     Delay between attempts.
+#   initial_delay: float
+#     Delay after the first failed attempt.
+#   max_delay: float
+#     Upper bound for the growing delay between attempts.
 # Returns:
 #   None
 # Raises:
 #   RuntimeError
 #     If cluster/query APIs do not become ready after retries.
-def wait_for_query_ready(client: Elasticsearch, attempts: int = 30, sleep_seconds: float = 2.0) -> None:
+# Notes:
+#   The yellow-status wait stays server-side; only the client-side pause between
+#   attempts backs off.
+def wait_for_query_ready(
+    client: Elasticsearch,
+    attempts: int = 30,
+    initial_delay: float = 0.1,
+    max_delay: float = 2.0,
+) -> None:
+    delay = initial_delay
     for attempt in range(1, attempts + 1):
         try:
             client.cluster.health(wait_for_status="yellow", timeout="30s")
@@ -131,33 +271,39 @@ def wait_for_query_ready(client: Elasticsearch, attempts: int = 30, sleep_second
         except Exception:
             pass
         print(f"Waiting for Elasticsearch query readiness... ({attempt}/{attempts})")
-        time.sleep(sleep_seconds)
+        time.sleep(delay)
+        delay = min(max_delay, delay * 1.5)
 
     raise RuntimeError("Elasticsearch query APIs did not become ready in time")
 
 
 # Args:
-#   func: callable
+#   func: Callable[..., Any]
 #     Operation to execute against Elasticsearch.
-#   attempts: int
-#     Maximum retry attempts.
-#   sleep_seconds: float
-#     Delay between attempts.
+#   *args: Any
+#     Positional arguments forwarded to func.
+#   **kwargs: Any
+#     Keyword arguments forwarded to func.
 # Returns:
 #   Any
 #     Return value from the callable upon success.
 # Raises:
 #   Exception
 #     Re-raises the last encountered exception after exhausting retries.
-def call_with_retries(func, attempts: int = 20, sleep_seconds: float = 1.5):
+# Notes:
+#   Backs off exponentially from RETRY_BASE_SECONDS, capped at RETRY_MAX_SECONDS,
+#   for up to RETRY_ATTEMPTS attempts.
+def call_with_retries(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
     last_exc = None
-    for attempt in range(1, attempts + 1):
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
         try:
-            return func()
+            return func(*args, **kwargs)
         except Exception as exc:
             last_exc = exc
-            print(f"Retrying after transient Elasticsearch error ({attempt}/{attempts}): {exc}")
-            time.sleep(sleep_seconds)
+            if attempt == RETRY_ATTEMPTS:
+                break
+            print(f"Retrying after transient Elasticsearch error ({attempt}/{RETRY_ATTEMPTS}): {exc}")
+            time.sleep(min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
     if last_exc:
         raise last_exc
     raise RuntimeError("Retry operation failed unexpectedly")
@@ -166,25 +312,14 @@ def call_with_retries(func, attempts: int = 20, sleep_seconds: float = 1.5):
 # Args:
 #   None
 # Returns:
-#   list[dict]
-#     Product documents loaded from data/catalog.json.
-def load_catalog_docs() -> list[dict]:
-    catalog_path = Path(__file__).resolve().parent.parent / "data" / "catalog.json"
-    with catalog_path.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-# Args:
-#   doc: dict
-#     Catalog document that may include key_specs.
-# Returns:
-#   str
-#     Flattened searchable key-spec string.
-def spec_blob(doc: dict) -> str:
-    specs = doc.get("key_specs", {})
-    if not isinstance(specs, dict):
-        return ""
-    return " ".join(f"{key} {value}" for key, value in specs.items())
+#   Iterator[bytes]
+#     Raw JSON lines from data/catalog.ndjson.gz, one document each, without newlines.
+def iter_catalog_lines() -> Iterator[bytes]:
+    with gzip.open(_CATALOG_PATH, "rb") as f:
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if line.strip():
+                yield line
 
 
 if __name__ == "__main__":